@@ -1,29 +1,208 @@
 from __future__ import absolute_import
 import os
 import json
+import logging
+import multiprocessing.util
+import queue
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
 
-from sentry import tagstore
 from sentry.plugins.bases import notify
 from sentry_plugins.base import CorePluginMixin
-from sentry.http import safe_urlopen, is_valid_url
-from sentry.utils.safe import safe_execute
 
 try:
     from sentry.integrations import FeatureDescription, IntegrationFeatures
 except ImportError:
     from sentry.integrations.base import FeatureDescription, IntegrationFeatures
 
+try:
+    from celery.signals import worker_process_shutdown
+except ImportError:
+    worker_process_shutdown = None
+
 import sentry_mattermost
 
+logger = logging.getLogger(__name__)
+
+# orjson - необязательная зависимость (extra "orjson"), без нее сериализуем стандартным json
+try:
+    import orjson
+    _dumps = orjson.dumps
+except ImportError:
+    def _dumps(obj):
+        return json.dumps(obj).encode("utf-8")
+
+_USER_AGENT = "sentry-mattermost/%s" % sentry_mattermost.VERSION
+
+_DESC = "Send notifications to Mattermost channel based on Sentry alerts rules"
+
+_API_URL = "https://band.wb.ru/api/v4/posts"
+
+# Токен читается один раз при загрузке модуля
+_TOKEN = os.environ.get("MATTERMOST_TOKEN")
+_AUTH = f"Bearer {_TOKEN}" if _TOKEN else None
+
+# Кэш опций проекта: правки настроек подхватываются не позже чем через _OPTION_TTL секунд
+_OPTION_TTL = 60
+# Пустые значения (проект не настроен) кэшируем короче, чтобы новая настройка включалась быстрее
+_NEGATIVE_OPTION_TTL = 30
+_OPTION_CACHE_SIZE = 512
+# Отдельный кэш пустых значений, чтобы ненастроенные проекты не вытесняли настроенные
+_NEGATIVE_OPTION_CACHE_SIZE = 4096
+
+# Постоянная сессия: keep-alive соединение с Mattermost переиспользуется между запросами
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+_SESSION.headers.update({
+    "Content-Type": "application/json",
+    "User-Agent": _USER_AGENT,
+})
+if _AUTH:
+    _SESSION.headers["Authorization"] = _AUTH
+
+_MSG_TMPL = (
+    "🚨 **Sentry Alert**\n"
+    "**[%(level)s] %(title)s**\n"
+    "\n"
+    "**Event ID**: %(event_id)s\n"
+    "**Project**: %(project)s\n"
+    "**Environment**: %(env)s\n"
+    "**Platform**: %(platform)s\n"
+    "\n"
+    "%(url)s"
+)
+
+# Уведомления отправляются фоновым потоком, чтобы notify() не блокировал
+# воркер Sentry на время HTTP-запроса.
+_MM_QUEUE = queue.Queue(maxsize=10_000)
+_MM_BATCH_SIZE = 100
+_MM_BATCH_WAIT = 1.0
+_MM_SEPARATOR = "\n---\n"
+# Лимит Mattermost на сообщение - 16383 символа, оставляем запас
+_MM_MAX_MESSAGE_LEN = 14000
+# Сколько ждать доставки очереди при завершении процесса (timeout запроса + окно батча)
+_MM_SHUTDOWN_TIMEOUT = 15
+_MM_SHUTDOWN = threading.Event()
+# Шаг ожидания внутри окна батча, чтобы воркер быстро замечал завершение процесса
+_MM_SHUTDOWN_POLL = 0.1
+_worker_thread = None
+_worker_lock = threading.Lock()
+
+
+def _cache_put(cache, limit, key, expires, value, now):
+    cache.pop(key, None)
+    if len(cache) >= limit:
+        for expired in [k for k, (exp, _) in cache.items() if exp <= now]:
+            del cache[expired]
+    while len(cache) >= limit:
+        # dict хранит порядок вставки - первым удаляем самый старый
+        del cache[next(iter(cache))]
+    cache[key] = (expires, value)
+
+
+def _drain_batch():
+    # Ждем первое событие, затем до _MM_BATCH_WAIT секунд собираем остальные из всплеска
+    items = [_MM_QUEUE.get()]
+    deadline = time.monotonic() + _MM_BATCH_WAIT
+    while len(items) < _MM_BATCH_SIZE:
+        timeout = deadline - time.monotonic()
+        if timeout > 0 and not _MM_SHUTDOWN.is_set():
+            try:
+                items.append(_MM_QUEUE.get(timeout=min(timeout, _MM_SHUTDOWN_POLL)))
+            except queue.Empty:
+                pass
+            continue
+        try:
+            items.append(_MM_QUEUE.get_nowait())
+        except queue.Empty:
+            break
+    return items
+
+
+def _chunk_messages(messages):
+    chunk = []
+    size = 0
+    for message in messages:
+        extra = len(message) + (len(_MM_SEPARATOR) if chunk else 0)
+        if chunk and size + extra > _MM_MAX_MESSAGE_LEN:
+            yield chunk
+            chunk = []
+            size = 0
+            extra = len(message)
+        chunk.append(message)
+        size += extra
+    if chunk:
+        yield chunk
+
+
+def _flush_batch(items, send):
+    batches = {}
+    for channel_id, payload in items:
+        batches.setdefault(channel_id, []).append(payload["message"])
+    for channel_id, messages in batches.items():
+        for chunk in _chunk_messages(messages):
+            payload = {
+                "channel_id": channel_id,
+                "message": _MM_SEPARATOR.join(chunk),
+            }
+            try:
+                send(channel_id, payload)
+            except Exception:
+                logger.exception("Failed to send batch to channel %s", channel_id)
+
+
+def _worker(send):
+    while True:
+        items = _drain_batch()
+        try:
+            _flush_batch(items, send)
+        finally:
+            for _ in items:
+                _MM_QUEUE.task_done()
+
+
+def _ensure_worker(send):
+    global _worker_thread
+    if _worker_thread is not None and _worker_thread.is_alive():
+        return
+    with _worker_lock:
+        if _worker_thread is None or not _worker_thread.is_alive():
+            _worker_thread = threading.Thread(
+                target=_worker, args=(send,), name="sentry-mattermost", daemon=True
+            )
+            _worker_thread.start()
+            # atexit не срабатывает в форкнутых дочерних процессах (они выходят через os._exit),
+            # а финализаторы multiprocessing - срабатывают. Реестр очищается при форке,
+            # поэтому регистрируем финализатор в том процессе, где запущен воркер.
+            multiprocessing.util.Finalize(None, _flush_on_exit, exitpriority=10)
+
+
+def _flush_on_exit():
+    # Поток-демон гибнет вместе с процессом - даем ему дослать очередь
+    _MM_SHUTDOWN.set()
+    deadline = time.monotonic() + _MM_SHUTDOWN_TIMEOUT
+    with _MM_QUEUE.all_tasks_done:
+        while _MM_QUEUE.unfinished_tasks:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            _MM_QUEUE.all_tasks_done.wait(remaining)
+        pending = _MM_QUEUE.unfinished_tasks
+    if pending:
+        logger.error("Dropping %s undelivered notification(s) on shutdown", pending)
+
+
+def _on_worker_process_shutdown(**kwargs):
+    _flush_on_exit()
 
-def get_tags(event):
-    tag_list = event.tags
-    if not tag_list:
-        return ()
 
-    return (
-        (tagstore.get_tag_key_label(k), tagstore.get_tag_value_label(k, v)) for k, v in tag_list
-    )
+# Дочерние процессы пула Celery (billiard) не запускают финализаторы multiprocessing,
+# зато перед выходом отправляют сигнал worker_process_shutdown
+if worker_process_shutdown is not None:
+    worker_process_shutdown.connect(_on_worker_process_shutdown, weak=False)
 
 
 class Mattermost(CorePluginMixin, notify.NotificationPlugin):
@@ -34,76 +213,91 @@ class Mattermost(CorePluginMixin, notify.NotificationPlugin):
     timeout = 10
     author = 'Radzhab'
     author_url = 'https://band.wb.ru'
-    user_agent = 'sentry-mattermost/%s' % version
-    feature_descriptions = [
-        FeatureDescription(
-            """
-            Send notifications to Mattermost channel based on Sentry alerts rules
-            """,
-            IntegrationFeatures.ALERT_RULE,
-        )
-    ]
+    user_agent = _USER_AGENT
+    feature_descriptions = [FeatureDescription(_DESC, IntegrationFeatures.ALERT_RULE)]
 
 
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._option_cache = {}
+        self._negative_option_cache = {}
+
+    def get_cached_option(self, key, project):
+        cache_key = (project.id, key)
+        now = time.monotonic()
+        for cache in (self._option_cache, self._negative_option_cache):
+            cached = cache.get(cache_key)
+            if cached is not None and cached[0] > now:
+                return cached[1]
+
+        value = self.get_option(key, project)
+        if value:
+            self._negative_option_cache.pop(cache_key, None)
+            _cache_put(self._option_cache, _OPTION_CACHE_SIZE, cache_key, now + _OPTION_TTL, value, now)
+        else:
+            self._option_cache.pop(cache_key, None)
+            _cache_put(
+                self._negative_option_cache,
+                _NEGATIVE_OPTION_CACHE_SIZE,
+                cache_key,
+                now + _NEGATIVE_OPTION_TTL,
+                value,
+                now,
+            )
+        return value
+
+    def set_option(self, key, value, project=None, user=None):
+        super().set_option(key, value, project=project, user=user)
+        self._invalidate_option(key, project)
+
+    def unset_option(self, key, project=None, user=None):
+        super().unset_option(key, project=project, user=user)
+        self._invalidate_option(key, project)
+
+    def _invalidate_option(self, key, project):
+        # Сброс в т.ч. закэшированного пустого значения: только что настроенный проект включается сразу
+        if project is not None:
+            self._option_cache.pop((project.id, key), None)
+            self._negative_option_cache.pop((project.id, key), None)
+
     def is_configured(self, project):
-        channel_id = self.get_option("channel_id", project)
-        token = os.getenv("MATTERMOST_TOKEN")
-        print(f"[MATTERMOST DEBUG] is_configured: channel_id={channel_id}, token_exists={bool(token)}")
-        return bool(channel_id and token)
+        # Без токена отправка невозможна - не трогаем опции проекта
+        if not self.get_mattermost_token():
+            logger.debug("is_configured: MATTERMOST_TOKEN is not set")
+            return False
+        channel_id = self.get_cached_option("channel_id", project)
+        logger.debug("is_configured: project=%s, channel_id=%s", project.id, channel_id)
+        return bool(channel_id)
 
     def get_mattermost_token(self):
-        return os.getenv("MATTERMOST_TOKEN")
+        return _TOKEN
 
-    def create_payload(self, event):
+    def create_payload(self, event, channel_id=None):
         group = event.group
         project = group.project
+        if channel_id is None:
+            channel_id = self.get_cached_option("channel_id", project)
         
-        # Получаем данные из event (аналогично gjson в Go коде)
-        level = event.get_tag("level") or "error"
-        title = group.title or "Unknown Error"  # заменил message_short на title
-        event_id = event.event_id
-        project_name = project.name
-        project_id = str(project.id)
-        platform = event.platform or "unknown"
-        release = event.release or "unknown"
-        environment = event.get_environment().name if event.get_environment() else "unknown"
-        message = event.message or ""
+        # get_environment() может обращаться к БД, а get_absolute_url() делает reverse() - вызываем по одному разу
+        env_obj = event.get_environment()
+        env_name = env_obj.name if env_obj else "unknown"
         url = group.get_absolute_url()
-        
-        # Извлекаем runtime информацию если есть
-        runtime_name = "unknown"
-        runtime_build = "unknown"
-        transaction = "unknown"
-        
-        if hasattr(event, 'data') and event.data:
-            contexts = event.data.get('contexts', {})
-            runtime = contexts.get('runtime', {})
-            runtime_name = runtime.get('name', 'unknown')
-            runtime_build = runtime.get('build', 'unknown')
-            transaction = event.data.get('transaction', 'unknown')
-        
-        # Извлекаем metadata
-        metadata_type = "unknown"
-        metadata_filename = "unknown" 
-        metadata_function = "unknown"
-        metadata_value = "unknown"
-        
-        if hasattr(event, 'data') and event.data:
-            metadata = event.data.get('metadata', {})
-            metadata_type = metadata.get('type', 'unknown')
-            metadata_filename = metadata.get('filename', 'unknown')
-            metadata_function = metadata.get('function', 'unknown')
-            metadata_value = metadata.get('value', 'unknown')
 
         # Пока простое сообщение без attachments для API v4
         payload = {
-            "channel_id": self.get_option("channel_id", project),
-            "message": f"🚨 **Sentry Alert**\n**[{level.upper()}] {title}**\n\n**Event ID**: {event_id}\n**Project**: {project_name}\n**Environment**: {environment}\n**Platform**: {platform}\n\n{url}"
+            "channel_id": channel_id,
+            "message": _MSG_TMPL % {
+                "level": (event.get_tag("level") or "error").upper(),
+                "title": group.title or "Unknown Error",
+                "event_id": event.event_id,
+                "project": project.name,
+                "env": env_name,
+                "platform": event.platform or "unknown",
+                "url": url,
+            },
         }
-        
-        print(f"[MATTERMOST DEBUG] Simple API payload: {payload}")
-        
+
         return payload
 
     def get_config(self, project, **kwargs):
@@ -140,61 +334,46 @@ class Mattermost(CorePluginMixin, notify.NotificationPlugin):
         token = self.get_mattermost_token()
         if not token:
             raise Exception("MM_BOT_TOKEN environment variable is not set")
-        
-        # Базовый URL для Mattermost API
-        mattermost_url = "https://band.wb.ru"
-        api_url = f"{mattermost_url}/api/v4/posts"
-        
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        }
-        
-        return safe_urlopen(
-            url=api_url,
-            json=payload,
-            headers=headers,
-            timeout=self.timeout
-        )
+
+        response = _SESSION.post(_API_URL, data=_dumps(payload), timeout=self.timeout)
+        # 401/403/429/5xx не должны теряться молча: ошибку логирует воркер или получает тест плагина
+        response.raise_for_status()
+        return response
 
     def notify(self, notification, raise_exception=False):
-        print(f"[MATTERMOST DEBUG v2.0 WEBHOOK] notify called for event: {notification.event.event_id}")
-        
         event = notification.event
         group = event.group
         project = group.project
-        
-        print(f"[MATTERMOST DEBUG] Project: {project.name}, Group: {group.id}")
-        
-        if not self.is_configured(project):
-            print("[MATTERMOST DEBUG] Plugin not configured, skipping")
-            return
-            
-        channel_id = self.get_option("channel_id", project)
+
+        logger.debug("notify: event=%s, project=%s, group=%s", event.event_id, project.id, group.id)
+
+        if raise_exception:
+            # Проверка из UI ("Test Plugin"): читаем настройку мимо кэша, чтобы учесть только что сохраненный канал
+            channel_id = self.get_option("channel_id", project)
+        else:
+            if not self.is_configured(project):
+                logger.debug("Plugin not configured for project %s, skipping", project.id)
+                return
+            channel_id = self.get_cached_option("channel_id", project)
+
         if not channel_id:
-            print("[MATTERMOST ERROR] No channel_id configured")
+            logger.error("No channel_id configured for project %s", project.id)
             return
-            
-        print(f"[MATTERMOST DEBUG] Creating payload for channel: {channel_id}")
-        payload = self.create_payload(event)
-        print(f"[MATTERMOST DEBUG] Payload created: {payload}")
-        print(f"[MATTERMOST DEBUG] Payload keys: {list(payload.keys())}")
-        if 'attachments' in payload:
-            print(f"[MATTERMOST DEBUG] Attachments: {payload['attachments']}")
-        
-        print(f"[MATTERMOST DEBUG] Calling send_to_mattermost")
-        try:
-            print(f"[MATTERMOST DEBUG] About to call send_to_mattermost with channel_id={channel_id}")
-            result = self.send_to_mattermost(channel_id, payload)
-            print(f"[MATTERMOST DEBUG] Send result: {result}")
-            print(f"[MATTERMOST DEBUG] Send result type: {type(result)}")
-            if hasattr(result, 'status_code'):
-                print(f"[MATTERMOST DEBUG] Status code: {result.status_code}")
-            return result
-        except Exception as e:
-            print(f"[MATTERMOST ERROR] Exception in notify: {e}")
-            import traceback
-            print(f"[MATTERMOST ERROR] Traceback: {traceback.format_exc()}")
-            if raise_exception:
+
+        payload = self.create_payload(event, channel_id)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Payload for channel %s: %s", channel_id, payload)
+
+        if raise_exception:
+            # Отправляем синхронно, чтобы ошибка дошла до пользователя
+            try:
+                return self.send_to_mattermost(channel_id, payload)
+            except Exception:
+                logger.exception("Failed to send event %s to channel %s", event.event_id, channel_id)
                 raise
-            return None
\ No newline at end of file
+
+        _ensure_worker(self.send_to_mattermost)
+        try:
+            _MM_QUEUE.put_nowait((channel_id, payload))
+        except queue.Full:
+            logger.error("Queue is full, dropping event %s", event.event_id)
@@ -9,6 +9,9 @@ setup(
     keywords="sentry mattermost",
     url="https://band.wb.ru",
     packages=find_packages(exclude=['tests']),
+    extras_require={
+        'orjson': ['orjson'],
+    },
     entry_points={
        'sentry.plugins': [
             'mattermost = sentry_mattermost.plugin:Mattermost'
@@ -0,0 +1,54 @@
+import sys
+import types
+
+
+def _install_sentry_stubs():
+    """Minimal stand-ins for the sentry modules plugin.py imports, used when Sentry itself is absent."""
+    try:
+        import sentry  # noqa: F401
+        return
+    except ImportError:
+        pass
+
+    class NotificationPlugin(object):
+        def __init__(self, *args, **kwargs):
+            self.options = {}
+
+        def get_option(self, key, project=None, user=None):
+            return self.options.get((project.id if project else None, key))
+
+        def set_option(self, key, value, project=None, user=None):
+            self.options[(project.id if project else None, key)] = value
+
+        def unset_option(self, key, project=None, user=None):
+            self.options.pop((project.id if project else None, key), None)
+
+    class CorePluginMixin(object):
+        pass
+
+    class FeatureDescription(object):
+        def __init__(self, description, feature):
+            self.description = description
+            self.feature = feature
+
+    class IntegrationFeatures(object):
+        ALERT_RULE = "alert-rule"
+
+    modules = {
+        "sentry": types.ModuleType("sentry"),
+        "sentry.plugins": types.ModuleType("sentry.plugins"),
+        "sentry.plugins.bases": types.ModuleType("sentry.plugins.bases"),
+        "sentry.plugins.bases.notify": types.ModuleType("sentry.plugins.bases.notify"),
+        "sentry.integrations": types.ModuleType("sentry.integrations"),
+        "sentry_plugins": types.ModuleType("sentry_plugins"),
+        "sentry_plugins.base": types.ModuleType("sentry_plugins.base"),
+    }
+    modules["sentry.plugins.bases.notify"].NotificationPlugin = NotificationPlugin
+    modules["sentry.plugins.bases"].notify = modules["sentry.plugins.bases.notify"]
+    modules["sentry.integrations"].FeatureDescription = FeatureDescription
+    modules["sentry.integrations"].IntegrationFeatures = IntegrationFeatures
+    modules["sentry_plugins.base"].CorePluginMixin = CorePluginMixin
+    sys.modules.update(modules)
+
+
+_install_sentry_stubs()
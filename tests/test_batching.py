@@ -0,0 +1,208 @@
+import logging
+import multiprocessing
+
+import pytest
+
+from sentry_mattermost import plugin
+
+
+def _msg(channel_id, text):
+    return channel_id, {"channel_id": channel_id, "message": text}
+
+
+class SendRecorder(object):
+    def __init__(self, fail_for=()):
+        self.calls = []
+        self.fail_for = fail_for
+
+    def __call__(self, channel_id, payload):
+        if channel_id in self.fail_for:
+            raise RuntimeError("boom")
+        self.calls.append((channel_id, payload))
+
+
+@pytest.fixture
+def small_limit(monkeypatch):
+    monkeypatch.setattr(plugin, "_MM_MAX_MESSAGE_LEN", 20)
+    monkeypatch.setattr(plugin, "_MM_SEPARATOR", "|||")
+
+
+def test_chunk_fits_exactly_at_limit_including_separators(small_limit):
+    # 7 + 3 + 10 == 20
+    chunks = list(plugin._chunk_messages(["a" * 7, "b" * 10]))
+    assert chunks == [["a" * 7, "b" * 10]]
+    assert len("|||".join(chunks[0])) == 20
+
+
+def test_chunk_splits_when_separator_crosses_limit(small_limit):
+    # 8 + 3 + 10 == 21
+    chunks = list(plugin._chunk_messages(["a" * 8, "b" * 10, "c"]))
+    assert chunks == [["a" * 8], ["b" * 10, "c"]]
+
+
+def test_single_message_over_limit_is_sent_alone(small_limit):
+    chunks = list(plugin._chunk_messages(["a", "x" * 50, "b"]))
+    assert chunks == [["a"], ["x" * 50], ["b"]]
+
+
+def test_chunk_empty():
+    assert list(plugin._chunk_messages([])) == []
+
+
+def test_flush_batch_groups_per_channel():
+    send = SendRecorder()
+    items = [_msg("c1", "one"), _msg("c2", "two"), _msg("c1", "three")]
+
+    plugin._flush_batch(items, send)
+
+    assert send.calls == [
+        ("c1", {"channel_id": "c1", "message": "one" + plugin._MM_SEPARATOR + "three"}),
+        ("c2", {"channel_id": "c2", "message": "two"}),
+    ]
+
+
+def test_flush_batch_splits_large_channel_batch(small_limit):
+    send = SendRecorder()
+    items = [_msg("c1", "a" * 15), _msg("c1", "b" * 15), _msg("c2", "c")]
+
+    plugin._flush_batch(items, send)
+
+    assert [(c, p["message"]) for c, p in send.calls] == [
+        ("c1", "a" * 15),
+        ("c1", "b" * 15),
+        ("c2", "c"),
+    ]
+
+
+def test_flush_batch_failure_does_not_stop_other_channels(caplog):
+    send = SendRecorder(fail_for=("c1",))
+
+    plugin._flush_batch([_msg("c1", "one"), _msg("c2", "two")], send)
+
+    assert send.calls == [("c2", {"channel_id": "c2", "message": "two"})]
+    assert "Failed to send batch to channel c1" in caplog.text
+
+
+@pytest.fixture
+def fresh_queue(monkeypatch):
+    q = plugin.queue.Queue()
+    monkeypatch.setattr(plugin, "_MM_QUEUE", q)
+    monkeypatch.setattr(plugin, "_MM_SHUTDOWN", plugin.threading.Event())
+    return q
+
+
+def test_drain_batch_coalesces_items_arriving_within_window(fresh_queue, monkeypatch):
+    monkeypatch.setattr(plugin, "_MM_BATCH_WAIT", 0.5)
+    fresh_queue.put(_msg("c1", "one"))
+    timer = plugin.threading.Timer(0.05, fresh_queue.put, args=(_msg("c1", "two"),))
+    timer.start()
+
+    items = plugin._drain_batch()
+    timer.join()
+
+    assert [p["message"] for _, p in items] == ["one", "two"]
+
+
+def test_drain_batch_stops_at_batch_size(fresh_queue, monkeypatch):
+    monkeypatch.setattr(plugin, "_MM_BATCH_SIZE", 3)
+    for i in range(5):
+        fresh_queue.put(_msg("c1", str(i)))
+
+    assert len(plugin._drain_batch()) == 3
+    assert fresh_queue.qsize() == 2
+
+
+def test_drain_batch_skips_window_on_shutdown(fresh_queue, monkeypatch):
+    monkeypatch.setattr(plugin, "_MM_BATCH_WAIT", 30)
+    plugin._MM_SHUTDOWN.set()
+    fresh_queue.put(_msg("c1", "one"))
+    fresh_queue.put(_msg("c1", "two"))
+
+    start = plugin.time.monotonic()
+    items = plugin._drain_batch()
+
+    assert len(items) == 2
+    assert plugin.time.monotonic() - start < 1
+
+
+def test_flush_on_exit_delivers_pending_items(fresh_queue, monkeypatch, caplog):
+    monkeypatch.setattr(plugin, "_MM_BATCH_WAIT", 30)
+    send = SendRecorder()
+    worker = plugin.threading.Thread(target=plugin._worker, args=(send,), daemon=True)
+    fresh_queue.put(_msg("c1", "one"))
+    fresh_queue.put(_msg("c2", "two"))
+    worker.start()
+
+    plugin._flush_on_exit()
+
+    assert sorted(c for c, _ in send.calls) == ["c1", "c2"]
+    assert "Dropping" not in caplog.text
+
+
+def test_flush_on_exit_logs_dropped_count(fresh_queue, monkeypatch, caplog):
+    monkeypatch.setattr(plugin, "_MM_SHUTDOWN_TIMEOUT", 0.05)
+    fresh_queue.put(_msg("c1", "one"))
+    fresh_queue.put(_msg("c1", "two"))
+
+    plugin._flush_on_exit()
+
+    assert "Dropping 2 undelivered notification(s) on shutdown" in caplog.text
+
+
+def test_drain_batch_keeps_waiting_past_poll_step(fresh_queue, monkeypatch):
+    monkeypatch.setattr(plugin, "_MM_BATCH_WAIT", 0.5)
+    monkeypatch.setattr(plugin, "_MM_SHUTDOWN_POLL", 0.02)
+    fresh_queue.put(_msg("c1", "one"))
+    timer = plugin.threading.Timer(0.2, fresh_queue.put, args=(_msg("c1", "two"),))
+    timer.start()
+
+    items = plugin._drain_batch()
+    timer.join()
+
+    assert len(items) == 2
+
+
+def _child_enqueue(path, block_send):
+    handler = logging.FileHandler(str(path) + ".log")
+    plugin.logger.addHandler(handler)
+
+    def send(channel_id, payload):
+        if block_send:
+            plugin.threading.Event().wait()
+        with open(str(path), "a") as f:
+            f.write("%s:%s\n" % (channel_id, payload["message"]))
+
+    plugin._ensure_worker(send)
+    plugin._MM_QUEUE.put_nowait(_msg("c1", "from-child"))
+
+
+def _run_forked_child(path, block_send):
+    ctx = multiprocessing.get_context("fork")
+    child = ctx.Process(target=_child_enqueue, args=(path, block_send))
+    child.start()
+    child.join(10)
+    assert child.exitcode == 0
+
+
+@pytest.fixture
+def forked_worker_state(fresh_queue, monkeypatch):
+    monkeypatch.setattr(plugin, "_worker_thread", None)
+    monkeypatch.setattr(plugin, "_MM_BATCH_WAIT", 30)
+
+
+def test_forked_child_delivers_queue_on_exit(forked_worker_state, tmp_path):
+    path = tmp_path / "sent"
+
+    _run_forked_child(path, block_send=False)
+
+    assert path.read_text() == "c1:from-child\n"
+
+
+def test_forked_child_logs_dropped_items_on_exit(forked_worker_state, tmp_path, monkeypatch):
+    monkeypatch.setattr(plugin, "_MM_SHUTDOWN_TIMEOUT", 0.2)
+    path = tmp_path / "sent"
+
+    _run_forked_child(path, block_send=True)
+
+    assert not path.exists()
+    assert "Dropping 1 undelivered notification(s) on shutdown" in (tmp_path / "sent.log").read_text()
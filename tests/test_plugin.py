@@ -0,0 +1,159 @@
+import types
+
+import pytest
+
+from sentry_mattermost import plugin
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(plugin.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def project():
+    return types.SimpleNamespace(id=1, name="backend")
+
+
+@pytest.fixture
+def mm(monkeypatch):
+    monkeypatch.setattr(plugin, "_TOKEN", "secret")
+    instance = plugin.Mattermost()
+    instance.lookups = 0
+    get_option = instance.get_option
+
+    def counting_get_option(key, project=None, user=None):
+        instance.lookups += 1
+        return get_option(key, project, user)
+
+    instance.get_option = counting_get_option
+    return instance
+
+
+def _event(project):
+    group = types.SimpleNamespace(
+        project=project, id=7, title="Boom", get_absolute_url=lambda: "https://sentry/issues/7/"
+    )
+    return types.SimpleNamespace(
+        group=group,
+        event_id="abc",
+        platform="python",
+        get_tag=lambda key: "error",
+        get_environment=lambda: None,
+    )
+
+
+def test_cached_option_is_served_within_ttl(mm, project, clock):
+    mm.set_option("channel_id", "c1", project)
+
+    assert mm.get_cached_option("channel_id", project) == "c1"
+    mm.options[(project.id, "channel_id")] = "c2"
+    clock.now += plugin._OPTION_TTL - 1
+    assert mm.get_cached_option("channel_id", project) == "c1"
+    assert mm.lookups == 1
+
+    clock.now += 2
+    assert mm.get_cached_option("channel_id", project) == "c2"
+    assert mm.lookups == 2
+
+
+def test_empty_option_expires_after_negative_ttl(mm, project, clock):
+    assert mm.get_cached_option("channel_id", project) is None
+    mm.options[(project.id, "channel_id")] = "c1"
+
+    clock.now += plugin._NEGATIVE_OPTION_TTL - 1
+    assert mm.get_cached_option("channel_id", project) is None
+    clock.now += 2
+    assert mm.get_cached_option("channel_id", project) == "c1"
+
+
+def test_set_option_invalidates_negative_entry(mm, project, clock):
+    assert not mm.is_configured(project)
+
+    mm.set_option("channel_id", "c1", project)
+
+    assert mm.is_configured(project)
+
+
+def test_unset_option_invalidates_entry(mm, project, clock):
+    mm.set_option("channel_id", "c1", project)
+    assert mm.get_cached_option("channel_id", project) == "c1"
+
+    mm.unset_option("channel_id", project)
+
+    assert mm.get_cached_option("channel_id", project) is None
+
+
+def test_full_cache_evicts_oldest_entry(mm, clock, monkeypatch):
+    monkeypatch.setattr(plugin, "_OPTION_CACHE_SIZE", 2)
+    projects = [types.SimpleNamespace(id=pid) for pid in range(3)]
+    for p in projects:
+        mm.set_option("channel_id", "c%s" % p.id, p)
+        mm.get_cached_option("channel_id", p)
+        clock.now += 1
+
+    assert list(mm._option_cache) == [(1, "channel_id"), (2, "channel_id")]
+
+
+def test_full_cache_drops_expired_entries_first(mm, clock, monkeypatch):
+    monkeypatch.setattr(plugin, "_NEGATIVE_OPTION_CACHE_SIZE", 3)
+    for pid in range(4):
+        mm.get_cached_option("channel_id", types.SimpleNamespace(id=pid))
+        if pid == 1:
+            clock.now += plugin._NEGATIVE_OPTION_TTL
+
+    assert list(mm._negative_option_cache) == [(2, "channel_id"), (3, "channel_id")]
+
+
+def test_unconfigured_projects_do_not_evict_configured(mm, project, clock, monkeypatch):
+    monkeypatch.setattr(plugin, "_OPTION_CACHE_SIZE", 1)
+    monkeypatch.setattr(plugin, "_NEGATIVE_OPTION_CACHE_SIZE", 1)
+    mm.set_option("channel_id", "c1", project)
+    assert mm.get_cached_option("channel_id", project) == "c1"
+
+    for pid in range(100, 110):
+        assert mm.get_cached_option("channel_id", types.SimpleNamespace(id=pid)) is None
+    lookups = mm.lookups
+
+    assert mm.get_cached_option("channel_id", project) == "c1"
+    assert mm.lookups == lookups
+    assert len(mm._negative_option_cache) == 1
+
+
+def test_is_configured_skips_options_without_token(mm, project, monkeypatch):
+    monkeypatch.setattr(plugin, "_TOKEN", None)
+    mm.set_option("channel_id", "c1", project)
+
+    assert not mm.is_configured(project)
+    assert mm.lookups == 0
+
+
+def test_test_action_reads_channel_uncached(mm, project, clock, monkeypatch):
+    sent = []
+    monkeypatch.setattr(mm, "send_to_mattermost", lambda channel_id, payload: sent.append(payload))
+    mm.set_option("channel_id", "old", project)
+    assert mm.get_cached_option("channel_id", project) == "old"
+    mm.options[(project.id, "channel_id")] = "new"
+
+    mm.notify(types.SimpleNamespace(event=_event(project)), raise_exception=True)
+
+    assert [p["channel_id"] for p in sent] == ["new"]
+
+
+def test_send_raises_on_error_status(mm, monkeypatch):
+    response = plugin.requests.Response()
+    response.status_code = 401
+    monkeypatch.setattr(plugin._SESSION, "post", lambda *args, **kwargs: response)
+
+    with pytest.raises(plugin.requests.HTTPError):
+        mm.send_to_mattermost("c1", {"channel_id": "c1", "message": "hi"})